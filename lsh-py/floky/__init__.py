@@ -12,6 +12,9 @@ QueryResult = namedtuple(
 
 
 class Base:
+    # cache the squared norms of the data points at fit time; only cosine similarity uses them.
+    _cache_sq_norms = False
+
     def __init__(
         self,
         lsh: Union[LshL2, LshL2Mem, LshSrp, LshSrpMem],
@@ -29,7 +32,9 @@ class Base:
         self.lsh = lsh
         self.seed = seed
         self.db_path = db_path
+        self.data_path = db_path + ".vecs"
         self.data = None
+        self.data_sq_norms = None
         self.in_mem = in_mem
         self.log = log
 
@@ -66,10 +71,13 @@ class Base:
             Shape: (dim, )
             Store data point `v`
         """
-        self.lsh.store_vec(v)
+        self.lsh.store_vecs(np.ascontiguousarray(v, dtype=np.float32).reshape(1, -1))
 
     def store_vecs(
-        self, vs: Union[np.ndarray, List[List[float]]], chunk_size: int = 250
+        self,
+        vs: Union[np.ndarray, List[List[float]]],
+        chunk_size: int = 250,
+        commit_every: int = 40,
     ):
         """
         Hash and store multiple vectors.
@@ -80,21 +88,40 @@ class Base:
             Shape: (n, dim)
             Storae data points `vs`
         chunk_size
-            How many chunks will be written to the backend at once.
+            Number of data points written to the backend at once.
             If an in memory backend is used this can be significantly higher compared to the SQLite backend.
-        """
-
+            Only used when `log` is set; otherwise all data points are passed to the backend in one call.
+        commit_every
+            Number of chunks written to the SQLite backend per transaction.
+            Like `chunk_size`, only used when `log` is set; otherwise all data points are
+            written in a single transaction.
+
+        Notes
+        -----
+        The GIL is released while hashing, so other Python threads keep running. This object is
+        locked until storing finishes; calling its methods from another thread in the meantime
+        raises a RuntimeError ("Already mutably borrowed"). Queries (`predict`,
+        `query_bucket_idx`) don't lock, and may run concurrently from multiple threads.
+        """
+        if commit_every < 1:
+            raise ValueError("commit_every should be at least 1")
+        vs = np.ascontiguousarray(vs, dtype=np.float32)
         length = len(vs)
+        if not self.log:
+            # chunking only serves the progress bar; let the backend iterate over all rows.
+            chunk_size = max(length, 1)
         i = chunk_size
         prev_i = 0
+        chunk_no = 0
 
         with tqdm(total=length, disable=not self.log) as pbar:
             while prev_i < length:
                 self.lsh.store_vecs(vs[prev_i:i])
                 prev_i = i
                 i += chunk_size
+                chunk_no += 1
                 pbar.update(chunk_size)
-                if not self.in_mem:
+                if not self.in_mem and chunk_no % commit_every == 0:
                     self.commit()
                     self.init_transaction()
         if not self.in_mem:
@@ -136,7 +163,28 @@ class Base:
         List of ids/ indexes
 
         """
-        return self.lsh.query_bucket_idx(v)
+        return self.query_bucket_idx_batch(np.reshape(v, (1, -1)))[0]
+
+    def query_bucket_idx_batch(
+        self, vs: Union[np.ndarray, List[List[float]]]
+    ) -> List[List[int]]:
+        """
+        Query union over colliding hash tables for multiple data points and return their index/ id.
+
+        Parameters
+        ----------
+        vs
+            Shape: (n, dim)
+            Query data points `vs`
+
+        Returns
+        -------
+        List of ids/ indexes per query data point
+
+        """
+        return self.lsh.query_bucket_idx_batch(
+            np.ascontiguousarray(vs, dtype=np.float32)
+        )
 
     def delete_vec(self, v: Union[np.ndarray, List[float]]):
         """
@@ -149,7 +197,20 @@ class Base:
             Data point `v`
 
         """
-        self.lsh.delete_vec(v)
+        self.delete_vecs(np.reshape(v, (1, -1)))
+
+    def delete_vecs(self, vs: Union[np.ndarray, List[List[float]]]):
+        """
+        Delete multiple vectors from hash tables. Depending on the backend this may or may not clear memory.
+
+        Parameters
+        ----------
+        vs
+            Shape: (n, dim)
+            Data points `vs`
+
+        """
+        self.lsh.delete_vecs(np.ascontiguousarray(vs, dtype=np.float32))
 
     def commit(self):
         """
@@ -170,6 +231,15 @@ class Base:
         """
         self.lsh.index()
 
+    def drop_index(self):
+        """
+        Drop the index of the SQLite backend. Bulk inserts are faster without an index,
+        call this before storing a batch that is large compared to the data already stored.
+        `store_vecs` recreates the index when it's done.
+        """
+        if not self.in_mem:
+            self.lsh.drop_index()
+
     def reset(self, dim: int):
         raise NotImplementedError
 
@@ -181,15 +251,57 @@ class Base:
         ----------
         X
             Shape: (n, dim)
-            The data points that should be hashed and stored
+            The data points that should be hashed and stored.
+            A C-contiguous float32 array (or with the SQLite backend, such a np.memmap) is
+            used as is, not copied. Don't modify it after fitting; call `fit` again instead.
         chunk_size
-            How many chunks will be written to the backend at once.
-            If an in memory backend is used this can be significantly higher compared to the SQLite backend.
-        """
-        dim = len(X[0])
-        self.reset(dim)
-        self.data = np.ascontiguousarray(np.array(X, dtype=np.float32))
-        self.lsh.increase_storage(len(X))
+            Number of data points copied to the memory mapped file at once (SQLite backend).
+            If `log` is set, also the number of data points written to the backend at once;
+            see `store_vecs`.
+
+        Notes
+        -----
+        This object is locked while fitting; other threads can't use it until `fit` returns (see `store_vecs`).
+        """
+        if self.in_mem:
+            X = np.ascontiguousarray(X, dtype=np.float32)
+            self.reset(X.shape[1])
+            self.data = X
+        elif (
+            isinstance(X, np.ndarray)
+            and self.data is not None
+            and np.may_share_memory(X, self.data)
+        ):
+            # `X` is (a view of) the current memory map, whose file is removed by `reset`.
+            X = np.array(X, dtype=np.float32)
+            self.reset(X.shape[1])
+            self.data = np.memmap(
+                self.data_path, dtype=np.float32, mode="w+", shape=X.shape
+            )
+            self.data[:] = X
+        elif (
+            isinstance(X, np.memmap)
+            and X.dtype == np.float32
+            and X.ndim == 2
+            and X.flags["C_CONTIGUOUS"]
+        ):
+            # already on disk in the right layout
+            self.reset(X.shape[1])
+            self.data = X
+        else:
+            # the SQLite backend keeps the data points on disk as well, next to the database file.
+            # Copy chunk wise, so that `X` is never converted as a whole in memory.
+            n, dim = len(X), len(X[0])
+            self.reset(dim)
+            self.data = np.memmap(
+                self.data_path, dtype=np.float32, mode="w+", shape=(n, dim)
+            )
+            for i in range(0, n, chunk_size):
+                self.data[i : i + chunk_size] = X[i : i + chunk_size]
+        if self._cache_sq_norms:
+            # squared norms are the same for every query, so only compute them once.
+            self.data_sq_norms = np.einsum("ij,ij->i", self.data, self.data)
+        self.lsh.increase_storage(len(self.data))
         self.store_vecs(self.data, chunk_size)
 
     def _predict(
@@ -223,21 +335,22 @@ class Base:
             raise ValueError("data attribute is not set")
         if not isinstance(x, (list, np.ndarray)):
             raise ValueError("x is not an array")
-        X = np.ascontiguousarray(np.array(x, dtype=np.float32))
-        if len(x.shape) == 1:
-            X = np.array([x])
-        elif len(x.shape) != 2:
+        X = np.ascontiguousarray(x, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        elif X.ndim != 2:
             raise ValueError("x should be a 2d array")
 
         qrs = []
         idx_batch = self.lsh.query_bucket_idx_batch(X)
-        sorted_idx, dist = sort_by_distances(X, self.data, distance_f, idx_batch, top_k, bound)
+        sorted_idx, dist = sort_by_distances(
+            X, self.data, distance_f, idx_batch, top_k, bound, self.data_sq_norms
+        )
         for sorted_idx, dist, original_idx in zip(sorted_idx, dist, idx_batch):
             if len(sorted_idx) == 0:
                 qrs.append(QueryResult([], [], 0, []))
                 continue
             original_idx = np.array(original_idx)
-            sorted_idx = np.array(sorted_idx)
             n_collisions = len(original_idx)
 
             idx = original_idx[sorted_idx]
@@ -251,10 +364,15 @@ class Base:
 
     def clean(self):
         """
-        Remove database file
+        Remove database file and the memory mapped data points.
         """
         if not self.in_mem:
             os.remove(self.db_path)
+            # release the memory map before its file is removed.
+            self.data = None
+            self.data_sq_norms = None
+            if os.path.exists(self.data_path):
+                os.remove(self.data_path)
 
     def to_mem(self, pages_per_step: int = 100):
         """
@@ -298,6 +416,7 @@ class L2(Base):
             Seed for the hashing functions. If set to zero, the hashing functions are randomly generated.
         db_path
             Path to SQLite database file. Only needed for SQLite backend.
+            The fitted data points are memory mapped to `{db_path}.vecs`.
         in_mem
             In memory backend or SQLite backend
         log
@@ -357,6 +476,8 @@ class L2(Base):
 
 
 class SRP(Base):
+    _cache_sq_norms = True
+
     def __init__(
         self,
         n_projections: int,
@@ -382,6 +503,7 @@ class SRP(Base):
             Seed for the hashing functions. If set to zero, the hashing functions are randomly generated.
         db_path
             Path to SQLite database file. Only needed for SQLite backend.
+            The fitted data points are memory mapped to `{db_path}.vecs`.
         in_mem
             In memory backend or SQLite backend
         log
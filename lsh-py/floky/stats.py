@@ -1,49 +1,98 @@
+import math
+from functools import lru_cache
 import numpy as np
-from scipy import stats
+from typing import Union, List
 
+_INV_PI = 1.0 / math.pi
+_SQRT_2PI = math.sqrt(2.0 * math.pi)
+_INV_SQRT_2 = 1.0 / math.sqrt(2.0)
 
-def collision_prob_l2(r: float, distance: float) -> float:
+
+def _collision_prob_l2_scalar(r: float, distance: float) -> float:
+    # Same as collision_prob_l2, with libm functions instead of numpy/ scipy ufuncs.
+    if distance == 0:
+        # like the numpy division: r / 0 == inf, 0 / 0 == nan
+        x = math.inf if r > 0 else math.nan
+    else:
+        x = r / distance
+    if x == 0:
+        return 0.0
+    a = math.erf(x * _INV_SQRT_2)
+    b = 2 / (_SQRT_2PI * x) * -math.expm1(-0.5 * x * x)
+    return a - b
+
+
+def collision_prob_l2(
+    r: Union[float, np.ndarray], distance: Union[float, np.ndarray]
+) -> Union[float, np.ndarray]:
     """
     Compute hash collision probability of L2
 
     Parameters
     ----------
-    r : float
+    r : float or array
         Hyperparameter r
-    distance : float
+    distance : float or array
         Distance R
 
     Returns
     -------
     P1
     """
-    # https://arxiv.org/pdf/1411.3787.pdf eq. 10
-    a = 1 - 2 * stats.norm.cdf(-r / distance)
-    b = (
-        2
-        / (np.sqrt(2 * np.pi) * r / distance)
-        * (1 - np.exp(-(r ** 2) / (2 * distance ** 2)))
-    )
-    return a - b
+    # https://arxiv.org/pdf/1411.3787.pdf eq. 10, with 1 - 2 * Phi(-x) == erf(x / sqrt(2))
+    if np.isscalar(r) and np.isscalar(distance):
+        return _collision_prob_l2_scalar(r, distance)
+    # scipy is only needed for array input; don't pay its import time on every import.
+    from scipy.special import erf
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.divide(r, distance)
+        a = erf(x * _INV_SQRT_2)
+        # 1 - exp(-x^2 / 2) == -expm1(-x^2 / 2), but accurate for small x.
+        b = 2 / (_SQRT_2PI * x) * -np.expm1(-0.5 * x * x)
+    # the limit for r -> 0; the formula itself gives 0 / 0 there.
+    return np.where(x == 0, 0.0, a - b)
 
 
-def collision_prob_cosine(sim: float) -> float:
+def collision_prob_cosine(sim: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
     """
     Compute hash collision probability of L2
 
     Parameters
     ----------
-    sim : float
+    sim : float or array
         Cosine similarity.
 
     Returns
     -------
     P1
     """
-    return 1.0 - np.arccos(sim) / np.pi
+    # float32 similarities may be slightly outside of [-1, 1].
+    if np.isscalar(sim):
+        return 1.0 - math.acos(min(max(sim, -1.0), 1.0)) * _INV_PI
+    return 1.0 - np.arccos(np.clip(sim, -1.0, 1.0)) * _INV_PI
 
 
-def det_prob_query(p1: float, k: int, l: int) -> float:
+@lru_cache(maxsize=4096)
+def _det_prob_query_scalar(p1: float, k: int, l: int) -> float:
+    # Same as det_prob_query with libm functions. Tuning loops often repeat the same
+    # (p1, k, l), hence the cache.
+    if k == 0 or p1 >= 1.0:
+        p1_k = 1.0
+    elif p1 <= 0.0:
+        p1_k = 0.0
+    else:
+        p1_k = math.exp(k * math.log(p1))
+    if l == 0:
+        return 0.0
+    if p1_k >= 1.0:
+        return 1.0
+    return -math.expm1(l * math.log1p(-p1_k))
+
+
+def det_prob_query(
+    p1: Union[float, np.ndarray], k: Union[int, np.ndarray], l: Union[int, np.ndarray]
+) -> Union[float, np.ndarray]:
     """
     Compute the probability of finding point q < cR
 
@@ -61,4 +110,58 @@ def det_prob_query(p1: float, k: int, l: int) -> float:
     Pq
         Prob. of finding point q < cR
     """
-    return 1.0 - (1.0 - p1 ** k) ** l
+    if np.isscalar(p1) and np.isscalar(k) and np.isscalar(l):
+        return _det_prob_query_scalar(p1, k, l)
+    # 1 - (1 - p1^k)^l evaluated in log space, so that p1^k doesn't underflow and
+    # 1 - (...) doesn't cancel. p1^0 == 1 and x^0 == 1 are set explicitly, as 0 * log(0)
+    # and 0 * log1p(-1) are nan.
+    k = np.asarray(k)
+    l = np.asarray(l)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_p1_k = np.where(k == 0, 0.0, k * np.log(p1))
+        pq = -np.expm1(l * np.log1p(-np.exp(log_p1_k)))
+    return np.where(l == 0, 0.0, pq)
+
+
+def tune_params(
+    distance: float,
+    r: Union[List[float], np.ndarray],
+    k: Union[List[int], np.ndarray],
+    l: Union[List[int], np.ndarray],
+    target: float,
+) -> np.ndarray:
+    """
+    Search the grid of L2 LSH parameters for combinations that find a point q < cR with
+    at least probability `target`.
+
+    Parameters
+    ----------
+    distance
+        Distance R
+    r
+        Shape: (n_r, )
+        Values of hyperparameter r
+    k
+        Shape: (n_k, )
+        Values of number of hash digits.
+    l
+        Shape: (n_l, )
+        Values of number of hash tables.
+    target
+        Minimal prob. of finding point q < cR
+
+    Returns
+    -------
+    Rows [r, k, l, Pq]
+        Shape: (n, 4)
+        The parameter combinations reaching `target`.
+    """
+    r = np.atleast_1d(np.asarray(r, dtype=np.float64))
+    k = np.atleast_1d(np.asarray(k))
+    l = np.atleast_1d(np.asarray(l))
+
+    # evaluate the whole (r, k, l) grid at once by broadcasting.
+    p1 = collision_prob_l2(r, distance)
+    pq = det_prob_query(p1[:, None, None], k[None, :, None], l[None, None, :])
+    ri, ki, li = np.nonzero(pq >= target)
+    return np.stack([r[ri], k[ki], l[li], pq[ri, ki, li]], axis=1)
@@ -1,31 +1,52 @@
 use ndarray::prelude::*;
-use pyo3::prelude::*;
 
-fn l2_dist(a: ArrayView1<f32>, b: ArrayView1<f32>) -> f32 {
-    let x = &a - &b;
-    l2_norm(x.view())
-}
-
-fn l2_norm(x: ArrayView1<f32>) -> f32 {
-    x.dot(&x).sqrt()
-}
-
-fn cosine_sim(a: ArrayView1<f32>, b: ArrayView1<f32>) -> f32 {
-    &a.dot(&b) / (l2_norm(a) * l2_norm(b))
-}
-
-pub fn cdist(q: ArrayView1<f32>, vs: &[ArrayView1<f32>], distance_f: &str) -> Vec<f32> {
-    let dist_fn = match distance_f {
-        "l2" | "euclidean" => l2_dist,
-        "cosine" => cosine_sim,
+/// Distances/ similarities between `q` and every row of `vs`.
+///
+/// Cosine similarities are derived from a single (blas) matrix-vector product `vs · q` and the
+/// squared norms of the rows `vs_sq`, which are computed here if not given.
+/// L2 distances sum the squared differences per row. Expanding them to
+/// `||q||^2 + ||v||^2 - 2 q·v` cancels badly in f32 for data that isn't centred near the origin.
+pub fn cdist(
+    q: ArrayView1<f32>,
+    vs: ArrayView2<f32>,
+    vs_sq: Option<ArrayView1<f32>>,
+    distance_f: &str,
+) -> Vec<f32> {
+    match distance_f {
+        "l2" | "euclidean" => vs
+            .outer_iter()
+            .map(|v| {
+                v.iter()
+                    .zip(q.iter())
+                    .map(|(&a, &b)| (a - b) * (a - b))
+                    .sum::<f32>()
+                    .sqrt()
+            })
+            .collect(),
+        "cosine" => {
+            let prod = vs.dot(&q);
+            let q_norm = q.dot(&q).sqrt();
+            match vs_sq {
+                Some(vs_sq) => prod
+                    .iter()
+                    .zip(vs_sq.iter())
+                    .map(|(&p, &v_sq)| p / (q_norm * v_sq.sqrt()))
+                    .collect(),
+                None => prod
+                    .iter()
+                    .zip(vs.outer_iter())
+                    .map(|(&p, v)| p / (q_norm * v.dot(&v).sqrt()))
+                    .collect(),
+            }
+        }
         _ => panic!("distance function not defined"),
-    };
-    vs.into_iter().map(|&v| dist_fn(q, v)).collect()
+    }
 }
 
 pub fn sort_by_distance(
     q: ArrayView1<f32>,
-    vs: &[ArrayView1<f32>],
+    vs: ArrayView2<f32>,
+    vs_sq: Option<ArrayView1<f32>>,
     distance_f: &str,
     top_k: usize,
 ) -> (Vec<usize>, Vec<f32>) {
@@ -37,16 +58,22 @@ pub fn sort_by_distance(
         _ => panic!("distance function not defined"),
     };
 
-    let dist = cdist(q, vs, distance_f);
+    let dist = cdist(q, vs, vs_sq, distance_f);
     let mut intermed: Vec<(usize, f32)> = dist.into_iter().enumerate().collect();
 
-    intermed.sort_unstable_by(|(_, a), (_, b)| {
+    let cmp = |(_, a): &(usize, f32), (_, b): &(usize, f32)| {
         let mut ord = a.partial_cmp(b).unwrap();
         if reverse {
             ord = ord.reverse()
         }
         ord
-    });
-    let (idx, dist): (Vec<_>, Vec<_>) = intermed.into_iter().take(top_k).unzip();
+    };
+    // quickselect the top k, so that only those need to be sorted.
+    if top_k < intermed.len() {
+        intermed.select_nth_unstable_by(top_k, cmp);
+        intermed.truncate(top_k);
+    }
+    intermed.sort_unstable_by(cmp);
+    let (idx, dist): (Vec<_>, Vec<_>) = intermed.into_iter().unzip();
     (idx, dist)
 }
@@ -8,48 +8,69 @@ use thiserror::Error;
 
 use ndarray::parallel::prelude::*;
 use ndarray::prelude::*;
-use numpy::PyArray2;
+use numpy::{PyArray1, PyArray2};
 use pyo3::prelude::*;
 
 #[pyfunction]
-#[text_signature = "(qs, vs, distance_f, indexes, top_k, /)"]
+#[text_signature = "(qs, vs, distance_f, indexes, top_k, bound, sq_norms, /)"]
 pub fn sort_by_distances(
+    py: Python,
     qs: &PyArray2<f32>,
     vs: &PyArray2<f32>,
     distance_f: &str,
     indexes: Vec<Vec<usize>>,
     top_k: usize,
     bound: Option<usize>,
-) -> PyResult<(Vec<Vec<usize>>, Vec<Vec<f32>>)> {
-    // let gil_guard = Python::acquire_gil();
-    // let py = gil_guard.python();
+    sq_norms: Option<&PyArray1<f32>>,
+) -> PyResult<(Vec<Py<PyArray1<i64>>>, Vec<Py<PyArray1<f32>>>)> {
     let distance_f = match distance_f {
         "cosine" => "cosine",
         "l2" | "euclidean" => "l2",
         _ => return Err(PyErr::new::<ValueError, _>("distance function not correct")),
     };
 
+    let qs = qs.as_array();
     let vs = vs.as_array();
-    // (Vec<usize>, Vec<f32>)
-    let r = qs
-        .as_array()
-        .axis_iter(Axis(0))
-        .into_par_iter()
-        .zip(indexes)
-        .map(|(q, idx)| {
-            let vs = idx
-                .iter()
-                .map(|i| vs.index_axis(Axis(0), *i))
-                .collect::<Vec<_>>();
-            let vs = match bound {
-                Some(i) => &vs[..std::cmp::min(i, vs.len() - 1)],
-                None => &vs,
-            };
-            sort_by_distance(q, vs, distance_f, top_k)
+    // squared norms of the rows of `vs`, if precomputed.
+    let sq_norms = sq_norms.map(|sq| sq.as_array());
+    // no python objects are touched while sorting, so other python threads may run.
+    let (idx, dist): (Vec<Vec<usize>>, Vec<Vec<f32>>) = py.allow_threads(|| {
+        qs.axis_iter(Axis(0))
+            .into_par_iter()
+            .zip(indexes)
+            .map(|(q, idx)| {
+                let idx = match bound {
+                    Some(i) => &idx[..std::cmp::min(i, idx.len() - 1)],
+                    None => &idx[..],
+                };
+                // gather the candidates in one contiguous buffer, so that the distances
+                // are computed in a single pass over memory.
+                let vs = vs.select(Axis(0), idx);
+                let vs_sq = sq_norms.map(|sq| sq.select(Axis(0), idx));
+                sort_by_distance(
+                    q,
+                    vs.view(),
+                    vs_sq.as_ref().map(|sq| sq.view()),
+                    distance_f,
+                    top_k,
+                )
+            })
+            .unzip()
+    });
+
+    // hand numpy arrays back, so that they can directly be used for indexing.
+    let idx = idx
+        .into_iter()
+        .map(|idx| {
+            let idx: Vec<i64> = idx.into_iter().map(|i| i as i64).collect();
+            PyArray1::from_vec(py, idx).to_owned()
         })
-        .unzip();
-
-    Ok(r)
+        .collect();
+    let dist = dist
+        .into_iter()
+        .map(|dist| PyArray1::from_vec(py, dist).to_owned())
+        .collect();
+    Ok((idx, dist))
 }
 
 // https://github.com/PyO3/pyo3/issues/696
@@ -126,8 +147,10 @@ impl Base {
         Ok(())
     }
 
-    fn _store_vecs(&mut self, vs: &PyArray2<f32>) -> IntResult<()> {
-        let vs = vs.as_array();
+    fn _store_vecs(&mut self, vs: ArrayView2<f32>) -> IntResult<()> {
+        if !vs.is_standard_layout() {
+            return Err(PyLshErr::NonContiguous);
+        }
         call_lsh_types!(&mut self.lsh, store_array, vs,)?;
         Ok(())
     }
@@ -147,6 +170,8 @@ impl Base {
         // allow threads doesn't make a difference on the rust side. But allows other python
         // code to run.
         // https://github.com/PyO3/pyo3/issues/649#issuecomment-546656381
+        // The SQLite backends hold a connection that isn't Sync, so they can't be shared
+        // with the threads that run while the GIL is released.
 
         let vs = vs.as_array();
         if !vs.is_standard_layout() {
@@ -154,10 +179,10 @@ impl Base {
         }
         let q = match &self.lsh {
             LshTypes::L2(lsh) => lsh.query_bucket_ids_batch_arr(vs),
-            LshTypes::L2Mem(lsh) => lsh.query_bucket_ids_batch_arr_par(vs),
+            LshTypes::L2Mem(lsh) => py.allow_threads(|| lsh.query_bucket_ids_batch_arr_par(vs)),
             LshTypes::MipsMem(lsh) => lsh.query_bucket_ids_batch_arr(vs),
             LshTypes::Srp(lsh) => lsh.query_bucket_ids_batch_arr(vs),
-            LshTypes::SrpMem(lsh) => lsh.query_bucket_ids_batch_arr_par(vs),
+            LshTypes::SrpMem(lsh) => py.allow_threads(|| lsh.query_bucket_ids_batch_arr_par(vs)),
             _ => panic!("base not initialized"),
         }?;
         Ok(q)
@@ -200,6 +225,17 @@ impl Base {
         Ok(())
     }
 
+    fn _delete_vecs(&mut self, vs: &PyArray2<f32>) -> IntResult<()> {
+        let vs = vs.as_array();
+        if !vs.is_standard_layout() {
+            return Err(PyLshErr::NonContiguous);
+        }
+        for v in vs.axis_iter(Axis(0)) {
+            call_lsh_types!(&mut self.lsh, delete_vec, v.as_slice().unwrap(),)?;
+        }
+        Ok(())
+    }
+
     fn _describe(&mut self) -> IntResult<String> {
         let s = call_lsh_types!(&mut self.lsh, describe,)?;
         Ok(s)
@@ -232,6 +268,15 @@ impl Base {
         Ok(())
     }
 
+    fn _drop_index(&self) -> IntResult<()> {
+        match &self.lsh {
+            LshTypes::L2(lsh) => lsh.hash_tables.as_ref().unwrap().drop_index_hash()?,
+            LshTypes::Srp(lsh) => lsh.hash_tables.as_ref().unwrap().drop_index_hash()?,
+            _ => panic!("base not initialized"),
+        };
+        Ok(())
+    }
+
     fn _to_mem(&mut self) -> IntResult<()> {
         match &mut self.lsh {
             LshTypes::L2(lsh) => lsh.hash_tables.as_mut().unwrap().to_mem()?,
@@ -256,8 +301,11 @@ impl Base {
         Ok(())
     }
 
-    fn store_vecs(&mut self, vs: &PyArray2<f32>) -> PyResult<()> {
-        self._store_vecs(vs);
+    fn store_vecs(&mut self, py: Python, vs: &PyArray2<f32>) -> PyResult<()> {
+        let vs = vs.as_array();
+        // hashing and storing doesn't need the GIL. `self` stays mutably borrowed, so other
+        // python threads using this object get a borrow error instead of waiting.
+        py.allow_threads(|| self._store_vecs(vs))?;
         Ok(())
     }
 
@@ -281,6 +329,11 @@ impl Base {
         Ok(())
     }
 
+    fn delete_vecs(&mut self, vs: &PyArray2<f32>) -> PyResult<()> {
+        self._delete_vecs(vs)?;
+        Ok(())
+    }
+
     fn describe(&mut self) -> PyResult<String> {
         let s = self._describe()?;
         Ok(s)
@@ -301,6 +354,11 @@ impl Base {
         Ok(())
     }
 
+    fn drop_index(&self) -> PyResult<()> {
+        self._drop_index()?;
+        Ok(())
+    }
+
     fn to_mem(&mut self) -> PyResult<()> {
         self._to_mem()?;
         Ok(())
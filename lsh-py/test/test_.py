@@ -1,54 +1,208 @@
 from floky import L2, SRP, QueryResult
 import numpy as np
-from scipy.spatial.distance import cdist
+import os
+import pytest
+import sqlite3
 from typing import List
 
 
 def get_mean_collisions(results: List[QueryResult]):
-    return np.mean(list(map(lambda qr: qr.n_collisions, results)))
+    return sum(qr.n_collisions for qr in results) / len(results)
 
 
-def test_l2():
-    # first check we don't get any error if we don't have results
-    np.random.seed(1)
-    n = 1
-    dim = 10
-    arr = np.random.randn(n, dim)
-    lsh = L2(n_projections=10, n_hash_tables=1, log=False, seed=1)
-    lsh.fit(arr)
-    assert lsh.predict(np.random.randn(1, dim))[0] == QueryResult([], [], 0, [])
+def get_hash_indexes(db_path: str) -> List[str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'hash_index_%'"
+        ).fetchall()
+    finally:
+        conn.close()
+    return sorted(name for name, in rows)
 
+
+@pytest.fixture(scope="module")
+def fitted_l2():
+    rng = np.random.default_rng(1)
     N = 10000
     n = 100
+    dim = 10
 
-    arr = np.random.randn(N, dim)
-    dist = cdist(arr[:n], arr, metric="euclidean")
-    # get top 4 non trivial results
-    top_k = dist.argsort(1)[:, 1:5]
-    top_k_dist = dist[np.arange(n)[:, None], top_k]
+    arr = rng.standard_normal((N, dim))
+    # euclidean distances via ||x||^2 + ||y||^2 - 2 x.y, all in one (n, N) buffer
+    sq_norms = np.einsum("ij,ij->i", arr, arr)
+    dist = np.empty((n, N))
+    np.matmul(arr[:n], arr.T, out=dist)
+    dist *= -2.0
+    dist += sq_norms[:n, None]
+    dist += sq_norms
+    np.maximum(dist, 0, out=dist)
+    np.sqrt(dist, out=dist)
+    # get top 4 non trivial results; the partition puts the trivial (self) result at 0
+    # and the 5 nearest in front, no need to fully sort.
+    top_k_dist = np.partition(dist, (0, 5), axis=1)[:, 1:5]
     # define the distance R to the mean of top_k distances
     R = top_k_dist.mean()
 
     # use that to rescale the data
-    arr /= R
+    inv_R = 1.0 / R
+    arr *= inv_R
 
     lsh = L2(n_projections=10, n_hash_tables=1, log=False, seed=1, r=4.0)
     lsh.fit(arr)
+    return lsh, inv_R
+
+
+def test_l2(fitted_l2):
+    # first check we don't get any error if we don't have results
+    # different seed than `fitted_l2`, so that the queries aren't points of the index.
+    rng = np.random.default_rng(2)
+    n = 1
+    dim = 10
+    arr = rng.standard_normal((n, dim))
+    lsh = L2(n_projections=10, n_hash_tables=1, log=False, seed=1)
+    lsh.fit(arr)
+    assert lsh.predict(rng.standard_normal((1, dim)))[0] == QueryResult([], [], 0, [])
 
-    query = np.random.randn(n, dim) / R
+    lsh, inv_R = fitted_l2
+    n = 100
+    query = rng.standard_normal((n, dim))
+    query *= inv_R
     results = lsh.predict(query, only_index=True, top_k=5)
     print(get_mean_collisions(results))
 
 
+def test_l2_offset():
+    # data far from the origin, where ||q||^2 + ||v||^2 - 2 q.v loses all precision in f32.
+    rng = np.random.default_rng(4)
+    N = 1000
+    n = 10
+    dim = 64
+
+    arr = rng.standard_normal((N, dim)) + 100.0
+    lsh = L2(n_projections=5, n_hash_tables=4, log=False, seed=1, r=10.0)
+    lsh.fit(arr)
+    query = arr[:n] + 0.01 * rng.standard_normal((n, dim))
+    results = lsh.predict(query, top_k=5)
+    for i, qr in enumerate(results):
+        assert qr.index[0] == i
+        expected = np.linalg.norm(
+            lsh.data[qr.index].astype(np.float64) - query[i].astype(np.float32), axis=1
+        )
+        np.testing.assert_allclose(qr.distances, expected, rtol=1e-4)
+
+
+def test_query_and_delete_batch():
+    rng = np.random.default_rng(6)
+    N = 1000
+    k = 10
+    dim = 10
+
+    arr = rng.standard_normal((N, dim))
+    lsh = L2(n_projections=5, n_hash_tables=2, log=False, seed=1, r=4.0)
+    lsh.fit(arr)
+    batch = lsh.query_bucket_idx_batch(arr[: 2 * k])
+    for v, ids in zip(arr[: 2 * k], batch):
+        assert lsh.query_bucket_idx(v) == lsh.query_bucket_idx_batch(v[None])[0]
+        # same buckets as the single vector path of the extension
+        assert sorted(ids) == sorted(lsh.lsh.query_bucket_idx(v.tolist()))
+
+    lsh.delete_vecs(arr[:k])
+    for i, ids in enumerate(lsh.query_bucket_idx_batch(arr[: 2 * k])):
+        if i < k:
+            assert i not in ids
+        else:
+            assert i in ids
+
+
 def test_srp():
-    np.random.seed(1)
+    rng = np.random.default_rng(1)
     N = 10000
     n = 100
     dim = 10
 
-    arr = np.random.randn(N, dim)
+    arr = rng.standard_normal((N, dim))
     lsh = SRP(n_projections=19, n_hash_tables=10, log=False, seed=1)
     lsh.fit(arr)
-    query = np.random.randn(n, dim)
+    query = rng.standard_normal((n, dim))
     results = lsh.predict(query)
     print(get_mean_collisions(results))
+
+
+def test_l2_sqlite(tmp_path):
+    rng = np.random.default_rng(3)
+    dim = 10
+    db_path = str(tmp_path / "lsh.db3")
+    lsh = L2(
+        n_projections=5,
+        n_hash_tables=2,
+        log=False,
+        seed=1,
+        db_path=db_path,
+        in_mem=False,
+    )
+
+    for N in (1000, 500):
+        # a second fit should replace the data and database of the first
+        arr = rng.standard_normal((N, dim))
+        lsh.fit(arr)
+        assert isinstance(lsh.data, np.memmap)
+        assert lsh.data.shape == (N, dim)
+        np.testing.assert_allclose(lsh.data, arr.astype(np.float32))
+
+        # refit on a view of the current memory map
+        lsh.fit(lsh.data[::2])
+        np.testing.assert_allclose(lsh.data, arr[::2].astype(np.float32))
+        lsh.fit(arr)
+
+        results = lsh.predict(arr[:10], top_k=1)
+        for i, qr in enumerate(results):
+            # every point collides with itself
+            assert qr.index[0] == i
+            np.testing.assert_allclose(qr.vectors[0], lsh.data[i])
+
+    lsh.clean()
+    assert lsh.data is None
+    assert not os.path.exists(db_path)
+    assert not os.path.exists(db_path + ".vecs")
+
+
+def test_sqlite_reindex(tmp_path):
+    rng = np.random.default_rng(5)
+    dim = 10
+    db_path = str(tmp_path / "lsh.db3")
+    lsh = L2(
+        n_projections=5,
+        n_hash_tables=2,
+        log=False,
+        seed=1,
+        db_path=db_path,
+        in_mem=False,
+    )
+    arr = rng.standard_normal((1500, dim))
+    lsh.fit(arr[:500])
+    indexes = get_hash_indexes(db_path)
+    assert len(indexes) == 2
+
+    lsh.drop_index()
+    assert get_hash_indexes(db_path) == []
+    # store_vecs recreates the dropped index, and a second call must not fail on the existing one
+    lsh.store_vecs(arr[500:1000])
+    assert get_hash_indexes(db_path) == indexes
+    lsh.store_vecs(arr[1000:])
+    assert get_hash_indexes(db_path) == indexes
+
+    # ids continue over all calls
+    for i in (0, 750, 1250):
+        assert i in lsh.query_bucket_idx(arr[i])
+    lsh.clean()
+
+    # nothing to drop for the in memory backend
+    lsh = L2(n_projections=5, n_hash_tables=2, log=False, seed=1)
+    lsh.fit(arr[:500])
+    lsh.drop_index()
+    lsh.store_vecs(arr[500:])
+    assert 750 in lsh.query_bucket_idx(arr[750])
+
+    with pytest.raises(ValueError):
+        lsh.store_vecs(arr[:10], commit_every=0)
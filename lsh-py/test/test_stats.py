@@ -0,0 +1,74 @@
+from floky.stats import (
+    collision_prob_cosine,
+    collision_prob_l2,
+    det_prob_query,
+    tune_params,
+)
+import numpy as np
+
+
+def test_collision_prob_cosine_rounding():
+    # similarities computed in float32 may be slightly larger than 1
+    assert collision_prob_cosine(np.float32(1.0000002)) == 1.0
+    assert collision_prob_cosine(np.float32(-1.0000002)) == 0.0
+    p = collision_prob_cosine(np.array([1.0000002, 0.5, -1.0000002], dtype=np.float32))
+    np.testing.assert_allclose(p, [1.0, 1.0 - np.arccos(0.5) / np.pi, 0.0])
+
+
+def test_collision_prob_l2_edges():
+    r = np.array([0.0, 0.0, 4.0, 4.0])
+    distance = np.array([1.0, 0.0, 0.0, 1.0])
+    # r == 0 takes the limit 0, distance == 0 always collides
+    expected = [0.0, np.nan, 1.0, collision_prob_l2(4.0, 1.0)]
+    np.testing.assert_allclose(collision_prob_l2(r, distance), expected)
+    np.testing.assert_allclose(
+        [collision_prob_l2(r_, d) for r_, d in zip(r, distance)], expected
+    )
+
+
+def test_tune_params():
+    R = 1.5
+    target = 0.9
+    r = [1.0, 4.0, 8.0]
+    k = [2, 5, 10]
+    l = [1, 10, 50]
+
+    expected = []
+    for r_ in r:
+        for k_ in k:
+            for l_ in l:
+                pq = det_prob_query(collision_prob_l2(r_, R), k_, l_)
+                if pq >= target:
+                    expected.append([r_, k_, l_, pq])
+
+    out = tune_params(R, r, k, l, target)
+    assert out.shape == (len(expected), 4)
+    np.testing.assert_allclose(out, expected)
+
+    # scalar inputs
+    out = tune_params(R, 8.0, 5, 50, target)
+    expected = det_prob_query(collision_prob_l2(8.0, R), 5, 50)
+    np.testing.assert_allclose(out, [[8.0, 5, 50, expected]])
+
+    # no combination reaches the target
+    assert tune_params(R, r, k, l, 1.1).shape == (0, 4)
+
+
+def test_det_prob_query():
+    p1 = [0.0, 0.3, 0.9, 1.0]
+    k = [0, 1, 3]
+    l = [0, 1, 4]
+
+    # scalar path against the direct formula
+    expected = np.empty((len(p1), len(k), len(l)))
+    for i, p1_ in enumerate(p1):
+        for j, k_ in enumerate(k):
+            for m, l_ in enumerate(l):
+                expected[i, j, m] = 1.0 - (1.0 - p1_ ** k_) ** l_
+                assert np.isclose(det_prob_query(p1_, k_, l_), expected[i, j, m])
+
+    # array path against the scalar path
+    out = det_prob_query(
+        np.array(p1)[:, None, None], np.array(k)[None, :, None], np.array(l)
+    )
+    np.testing.assert_allclose(out, expected)
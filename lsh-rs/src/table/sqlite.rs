@@ -228,13 +228,25 @@ where
         for tbl_name in get_table_names(self.n_hash_tables) {
             self.conn.execute_batch(&format!(
                 "
-                CREATE INDEX hash_index_{}
+                CREATE INDEX IF NOT EXISTS hash_index_{}
                 ON {} (hash);",
                 tbl_name, tbl_name
             ))?;
         }
         Ok(())
     }
+
+    /// Drop the hash indexes, so that bulk inserts don't need to update them.
+    /// Recreate them with `index_hash` once the inserts are done.
+    pub fn drop_index_hash(&self) -> Result<()> {
+        self.commit()?;
+        for tbl_name in get_table_names(self.n_hash_tables) {
+            self.conn
+                .execute_batch(&format!("DROP INDEX IF EXISTS hash_index_{};", tbl_name))?;
+        }
+        self.init_transaction()?;
+        Ok(())
+    }
 }
 
 impl<N, K> HashTables<N, K> for SqlTable<N, K>
@@ -370,6 +382,16 @@ mod test {
         stmt.query([]).expect("query failed");
     }
 
+    #[test]
+    fn test_index_hash_rebuild() {
+        let sql = SqlTableMem::<f32, i8>::new(1, true, ".").unwrap();
+        sql.index_hash().unwrap();
+        sql.drop_index_hash().unwrap();
+        sql.index_hash().unwrap();
+        // indexing an already indexed table should not fail
+        sql.index_hash().unwrap();
+    }
+
     #[test]
     fn test_sql_crud() {
         let mut sql = *SqlTableMem::new(1, true, ".").unwrap();